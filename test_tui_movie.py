@@ -0,0 +1,54 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import tui_movie
+
+
+class WriteAllTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(tui_movie.sys, "stdout", SimpleNamespace(fileno=lambda: 1))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_batches_and_resumes_after_short_writes(self):
+        written = bytearray()
+        batch_sizes = []
+
+        def short_writev(_fd, buffers):
+            batch_sizes.append(len(buffers))
+            data = b"".join(bytes(buffer) for buffer in buffers)[:3]
+            written.extend(data)
+            return len(data)
+
+        chunks = [b"abcde", b"", b"f", b"ghij", b"k", b"lmnopq"]
+        with mock.patch.object(tui_movie, "IOV_MAX", 2), mock.patch.object(
+            tui_movie.os, "writev", side_effect=short_writev
+        ):
+            tui_movie.write_all(*chunks)
+
+        self.assertEqual(bytes(written), b"".join(chunks))
+        self.assertLessEqual(max(batch_sizes), 2)
+
+    def test_zero_byte_writev_raises(self):
+        with mock.patch.object(tui_movie.os, "writev", return_value=0):
+            with self.assertRaises(OSError):
+                tui_movie.write_all(b"frame", b"status")
+
+
+class IovMaxTest(unittest.TestCase):
+    def test_uses_reported_limit(self):
+        with mock.patch.object(tui_movie.os, "sysconf", return_value=16):
+            self.assertEqual(tui_movie.iov_max(), 16)
+
+    def test_falls_back_when_unlimited(self):
+        with mock.patch.object(tui_movie.os, "sysconf", return_value=-1):
+            self.assertEqual(tui_movie.iov_max(), 1024)
+
+    def test_falls_back_when_unsupported(self):
+        with mock.patch.object(tui_movie.os, "sysconf_names", {}):
+            self.assertEqual(tui_movie.iov_max(), 1024)
+
+
+if __name__ == "__main__":
+    unittest.main()
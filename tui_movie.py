@@ -1,35 +1,118 @@
 #!/usr/bin/env python3
+import argparse
 import math
 import os
 import random
+import re
 import select
 import signal
 import sys
 import termios
 import time
 import tty
+from array import array
 from dataclasses import dataclass
+from functools import lru_cache
 from shutil import get_terminal_size
 
 
 ESC = "\x1b"
+RESET = b"\x1b[0m"
+DEFAULT_FG = b"\x1b[39m"
 
-
-@dataclass(frozen=True)
-class Cell:
-    ch: str
-    fg: tuple | None = None
-    bg: tuple | None = None
+# Packed cell attributes: bits 0-23 hold the background RGB, bits 24-47 the
+# foreground RGB, and bit 48 is set when the cell has a foreground color.
+FG_SHIFT = 24
+HAS_FG = 1 << 48
+RGB_MASK = 0xFFFFFF
 
 
-def fg_color(rgb: tuple[int, int, int]) -> str:
+def pack_rgb(rgb: tuple[int, int, int]) -> int:
     r, g, b = rgb
-    return f"{ESC}[38;2;{r};{g};{b}m"
+    return (r << 16) | (g << 8) | b
 
 
-def bg_color(rgb: tuple[int, int, int]) -> str:
-    r, g, b = rgb
-    return f"{ESC}[48;2;{r};{g};{b}m"
+def unpack_rgb(value: int) -> tuple[int, int, int]:
+    return (value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF
+
+
+@lru_cache(maxsize=65536)
+def fg_color(rgb: int) -> bytes:
+    r, g, b = unpack_rgb(rgb)
+    return f"{ESC}[38;2;{r};{g};{b}m".encode()
+
+
+@lru_cache(maxsize=65536)
+def bg_color(rgb: int) -> bytes:
+    r, g, b = unpack_rgb(rgb)
+    return f"{ESC}[48;2;{r};{g};{b}m".encode()
+
+
+# xterm-256 colors 16-231 form a 6x6x6 cube over these channel levels and
+# 232-255 a 24-step gray ramp; 0-15 are left alone since themes redefine them.
+CUBE_LEVELS = (0, 95, 135, 175, 215, 255)
+
+
+def xterm_256_rgb(index: int) -> tuple[int, int, int]:
+    if index >= 232:
+        level = 8 + 10 * (index - 232)
+        return level, level, level
+    index -= 16
+    return CUBE_LEVELS[index // 36], CUBE_LEVELS[index // 6 % 6], CUBE_LEVELS[index % 6]
+
+
+PALETTE_256 = [(index, xterm_256_rgb(index)) for index in range(16, 256)]
+
+
+@lru_cache(maxsize=65536)
+def quantize_256(rgb: int) -> int:
+    r, g, b = unpack_rgb(rgb)
+    return min(
+        PALETTE_256,
+        key=lambda entry: (entry[1][0] - r) ** 2 + (entry[1][1] - g) ** 2 + (entry[1][2] - b) ** 2,
+    )[0]
+
+
+@lru_cache(maxsize=65536)
+def quantize_attr_256(value: int) -> int:
+    """Packed attribute word with both colors replaced by palette indices."""
+    bg_rgb = value & RGB_MASK
+    bg = ground_index_256() if bg_rgb == pack_rgb(GROUND_COLOR) else quantize_256(bg_rgb)
+    if value & HAS_FG:
+        return HAS_FG | (quantize_256((value >> FG_SHIFT) & RGB_MASK) << FG_SHIFT) | bg
+    return bg
+
+
+@lru_cache(maxsize=1)
+def ground_index_256() -> int:
+    """Palette index for the ground, nudged off the sky color at the horizon.
+
+    The ground and the lowest sky rows are close enough to land on the same
+    palette entry, which would erase the horizon in 256-color mode.
+    """
+    horizon = tuple(lerp(top, bottom, 0.7) for top, bottom in zip(SKY_TOP, SKY_BOTTOM))
+    index = quantize_256(pack_rgb(GROUND_COLOR))
+    if index == quantize_256(pack_rgb(horizon)):
+        index = index - 1 if index > 232 else index + 1
+    return index
+
+
+@lru_cache(maxsize=256)
+def fg_color_256(index: int) -> bytes:
+    return f"{ESC}[38;5;{index}m".encode()
+
+
+@lru_cache(maxsize=256)
+def bg_color_256(index: int) -> bytes:
+    return f"{ESC}[48;5;{index}m".encode()
+
+
+# Per mode: fg and bg SGR encoders, plus an optional mapping applied to
+# attribute words first so cells that quantize alike compare equal.
+COLOR_MODES = {
+    "truecolor": (fg_color, bg_color, None),
+    "256": (fg_color_256, bg_color_256, quantize_attr_256),
+}
 
 
 def reset_colors() -> str:
@@ -51,6 +134,34 @@ def clear_screen() -> None:
     sys.stdout.flush()
 
 
+def iov_max() -> int:
+    """Most buffers one writev call accepts, or 1024 if the OS reports no limit."""
+    if "SC_IOV_MAX" in os.sysconf_names:
+        limit = os.sysconf("SC_IOV_MAX")
+        if limit > 0:
+            return limit
+    return 1024
+
+
+IOV_MAX = iov_max()
+
+
+def write_all(*chunks: bytes) -> None:
+    """Gather-write ``chunks`` straight to the stdout fd, bypassing Python's buffering."""
+    fd = sys.stdout.fileno()
+    views = [memoryview(chunk) for chunk in chunks if chunk]
+    while views:
+        written = os.writev(fd, views[:IOV_MAX])
+        if not written:
+            raise OSError("writev to stdout wrote 0 bytes")
+        while written:
+            if written >= len(views[0]):
+                written -= len(views.pop(0))
+            else:
+                views[0] = views[0][written:]
+                written = 0
+
+
 def nonblocking_read() -> str | None:
     if select.select([sys.stdin], [], [], 0)[0]:
         return sys.stdin.read(1)
@@ -61,9 +172,14 @@ def lerp(a: int, b: int, t: float) -> int:
     return int(a + (b - a) * t)
 
 
+SKY_TOP = (15, 20, 35)
+SKY_BOTTOM = (5, 10, 18)
+GROUND_COLOR = (10, 12, 18)
+
+
 def gradient_color(y: int, height: int) -> tuple[int, int, int]:
-    top = (15, 20, 35)
-    bottom = (5, 10, 18)
+    top = SKY_TOP
+    bottom = SKY_BOTTOM
     t = y / max(1, height - 1)
     return (
         lerp(top[0], bottom[0], t),
@@ -72,123 +188,315 @@ def gradient_color(y: int, height: int) -> tuple[int, int, int]:
     )
 
 
+RAIN_PERIOD = 17
+# Modular inverse of the rain's x stride (7) mod RAIN_PERIOD, so the first
+# rain column of a row can be solved for directly instead of tested per cell.
+RAIN_X_INVERSE = 5
+
+
+@dataclass
+class FrameBuffer:
+    """Row-major frame: a UTF-8 encoded glyph and a packed attribute word per cell."""
+
+    width: int
+    height: int
+    ch: list[bytes]
+    attr: array
+
+    @classmethod
+    def blank(cls, width: int, height: int) -> "FrameBuffer":
+        size = width * height
+        return cls(width, height, [b" "] * size, array("Q", [0]) * size)
+
+    def copy(self) -> "FrameBuffer":
+        return FrameBuffer(self.width, self.height, self.ch.copy(), self.attr[:])
+
+    def fill_bg(self, start: int, stop: int, rgb: tuple[int, int, int]) -> None:
+        """Set the background of a span, clearing any foreground color."""
+        self.attr[start:stop] = array("Q", [pack_rgb(rgb)]) * (stop - start)
+
+    def _paint_fg(self, start: int, stop: int, step: int, fg: tuple[int, int, int] | None) -> None:
+        fg_bits = HAS_FG | (pack_rgb(fg) << FG_SHIFT) if fg else 0
+        self.attr[start:stop:step] = array(
+            "Q", [(value & RGB_MASK) | fg_bits for value in self.attr[start:stop:step]]
+        )
+
+    def fill_glyph(
+        self,
+        start: int,
+        stop: int,
+        ch: str,
+        fg: tuple[int, int, int] | None,
+        step: int = 1,
+    ) -> None:
+        count = len(range(start, stop, step))
+        if count <= 0:
+            return
+        self.ch[start:stop:step] = [ch.encode()] * count
+        self._paint_fg(start, stop, step, fg)
+
+    def write_glyphs(
+        self, start: int, glyphs: tuple[bytes, ...], fg: tuple[int, int, int]
+    ) -> None:
+        stop = start + len(glyphs)
+        self.ch[start:stop] = glyphs
+        self._paint_fg(start, stop, 1, fg)
+
+
+SPRITE_RUN = re.compile(r"[^ ]+")
+
+
+@lru_cache(maxsize=16)
+def sprite_runs(sprite: tuple[str, ...]) -> tuple[tuple[int, int, tuple[bytes, ...]], ...]:
+    """Display list for a sprite: (row, column, encoded glyphs) per non-blank run."""
+    return tuple(
+        (row_idx, run.start(), tuple(glyph.encode() for glyph in run.group()))
+        for row_idx, row in enumerate(sprite)
+        for run in SPRITE_RUN.finditer(row)
+    )
+
+
 def place_sprite(
-    buffer: list[list[Cell]],
-    sprite: list[str],
+    buffer: FrameBuffer,
+    sprite: tuple[str, ...],
     x: int,
     y: int,
     color: tuple[int, int, int],
 ) -> None:
-    height = len(buffer)
-    width = len(buffer[0]) if height else 0
-    for row_idx, row in enumerate(sprite):
-        for col_idx, ch in enumerate(row):
-            if ch == " ":
-                continue
-            px = x + col_idx
-            py = y + row_idx
-            if 0 <= px < width and 0 <= py < height:
-                buffer[py][px] = Cell(ch, fg=color, bg=buffer[py][px].bg)
+    height = buffer.height
+    width = buffer.width
+    for row_idx, col, glyphs in sprite_runs(sprite):
+        py = y + row_idx
+        if not 0 <= py < height:
+            continue
+        x0 = max(0, x + col)
+        x1 = min(width, x + col + len(glyphs))
+        if x0 < x1:
+            buffer.write_glyphs(py * width + x0, glyphs[x0 - x - col : x1 - x - col], color)
+
+
+LEFT_SPRITE = (
+    "   /|\\     ",
+    "  /_|_\\    ",
+    "   / \\     ",
+    "  /___\\    ",
+    "   | |     ",
+    "  /  |\\    ",
+    " /   | \\   ",
+    "/    |  \\  ",
+)
+RIGHT_SPRITE = (
+    "     /|\\   ",
+    "    /_|_\\  ",
+    "     / \\   ",
+    "    /___\\  ",
+    "     | |   ",
+    "    /|  \\  ",
+    "   / |   \\ ",
+    "  /  |    \\",
+)
+
+
+@dataclass(frozen=True)
+class SceneLayout:
+    ground_y: int
+    dot_y: int
+    mid_y: int
+    left_x: int
+    right_x: int
+    slash_y: int
+    slash_x: int
+
+
+@lru_cache(maxsize=4)
+def scene_layout(width: int, height: int) -> SceneLayout:
+    mid_y = int(height * 0.45)
+    return SceneLayout(
+        ground_y=int(height * 0.7),
+        dot_y=height - 2,
+        mid_y=mid_y,
+        left_x=max(2, int(width * 0.2) - 5),
+        right_x=min(width - 12, int(width * 0.7)),
+        slash_y=mid_y + 2,
+        slash_x=int(width * 0.45),
+    )
+
+
+@lru_cache(maxsize=4)
+def background_template(width: int, height: int) -> FrameBuffer:
+    """Static sky gradient and ground; callers must copy before drawing."""
+    buffer = FrameBuffer.blank(width, height)
+    ground_y = scene_layout(width, height).ground_y
+    for y in range(ground_y):
+        buffer.fill_bg(y * width, (y + 1) * width, gradient_color(y, height))
+    buffer.fill_bg(ground_y * width, height * width, GROUND_COLOR)
+    return buffer
 
 
-def build_frame(width: int, height: int, frame: int) -> list[list[Cell]]:
-    buffer: list[list[Cell]] = []
+@lru_cache(maxsize=4)
+def rain_layers(width: int, height: int) -> list[FrameBuffer]:
+    """Static scene with rain for each of the RAIN_PERIOD rain offsets.
+
+    Layer ``k`` holds the rain pattern for frames where
+    ``frame * rain_speed % RAIN_PERIOD == k``, with the left samurai and the
+    slash (fixed color and position for a given size) already drawn on top.
+    Callers must copy before drawing.
+    """
+    layout = scene_layout(width, height)
+    layers = []
+    for offset in range(RAIN_PERIOD):
+        layer = background_template(width, height).copy()
+        for y in range(layout.ground_y):
+            start = y * width
+            first = (-(y * 3 + offset) * RAIN_X_INVERSE) % RAIN_PERIOD
+            layer.fill_glyph(start + first, start + width, "╲", (120, 160, 200), RAIN_PERIOD)
+        place_sprite(layer, LEFT_SPRITE, layout.left_x, layout.mid_y, (200, 200, 210))
+        if 0 <= layout.slash_y < height:
+            start = layout.slash_y * width
+            stop = start + min(width, layout.slash_x + 6)
+            layer.fill_glyph(start + layout.slash_x, stop, "─", (240, 220, 120))
+        layers.append(layer)
+    return layers
+
+
+def build_frame(width: int, height: int, frame: int) -> FrameBuffer:
+    # Only the ground dots and the shimmering right samurai change per frame;
+    # at the sizes main allows (>= 40x19) neither overlaps the pre-drawn layer
+    # sprites, so drawing them last preserves the original paint order.
+    layout = scene_layout(width, height)
     rain_speed = 2
-    for y in range(height):
-        row: list[Cell] = []
-        bg = gradient_color(y, height)
-        for x in range(width):
-            ch = " "
-            fg = None
-            bg_cell = bg
-            if (x * 7 + y * 3 + frame * rain_speed) % 17 == 0:
-                ch = "╲"
-                fg = (120, 160, 200)
-            row.append(Cell(ch, fg=fg, bg=bg_cell))
-        buffer.append(row)
+    buffer = rain_layers(width, height)[frame * rain_speed % RAIN_PERIOD].copy()
 
     shimmer = int(30 + 20 * math.sin(frame / 6))
-    ground_color = (10, 12, 18)
-    for y in range(int(height * 0.7), height):
-        for x in range(width):
-            buffer[y][x] = Cell(" ", fg=None, bg=ground_color)
-            if (x + frame) % 23 == 0 and y == height - 2:
-                buffer[y][x] = Cell("·", fg=(80, 90, 120), bg=ground_color)
-
-    left_sprite = [
-        "   /|\\     ",
-        "  /_|_\\    ",
-        "   / \\     ",
-        "  /___\\    ",
-        "   | |     ",
-        "  /  |\\    ",
-        " /   | \\   ",
-        "/    |  \\  ",
-    ]
-    right_sprite = [
-        "     /|\\   ",
-        "    /_|_\\  ",
-        "     / \\   ",
-        "    /___\\  ",
-        "     | |   ",
-        "    /|  \\  ",
-        "   / |   \\ ",
-        "  /  |    \\",
-    ]
-
-    mid_y = int(height * 0.45)
-    left_x = max(2, int(width * 0.2) - 5)
-    right_x = min(width - 12, int(width * 0.7))
-    place_sprite(buffer, left_sprite, left_x, mid_y, (200, 200, 210))
-    place_sprite(buffer, right_sprite, right_x, mid_y, (210, 180, shimmer))
-
-    slash_y = mid_y + 2
-    slash_x = int(width * 0.45)
-    if 0 <= slash_y < height:
-        for i in range(6):
-            px = slash_x + i
-            if 0 <= px < width:
-                buffer[slash_y][px] = Cell("─", fg=(240, 220, 120), bg=buffer[slash_y][px].bg)
+    if layout.dot_y >= layout.ground_y:
+        start = layout.dot_y * width
+        buffer.fill_glyph(start + (-frame) % 23, start + width, "·", (80, 90, 120), 23)
 
+    place_sprite(buffer, RIGHT_SPRITE, layout.right_x, layout.mid_y, (210, 180, shimmer))
     return buffer
 
 
-def render_frame(buffer: list[list[Cell]]) -> str:
-    lines: list[str] = []
-    last_fg = None
-    last_bg = None
-    for row in buffer:
-        line_parts: list[str] = []
-        for cell in row:
-            if cell.bg != last_bg:
-                if cell.bg is None:
-                    line_parts.append(reset_colors())
-                else:
-                    line_parts.append(bg_color(cell.bg))
-                last_bg = cell.bg
-            if cell.fg != last_fg:
-                if cell.fg is None:
-                    line_parts.append(f"{ESC}[39m")
-                else:
-                    line_parts.append(fg_color(cell.fg))
-                last_fg = cell.fg
-            line_parts.append(cell.ch)
-        line_parts.append(reset_colors())
-        lines.append("".join(line_parts))
-        last_fg = None
-        last_bg = None
-    return "\n".join(lines)
-
-
-def main() -> int:
+def render_frame(
+    buffer: FrameBuffer, colors: str = "truecolor", out: bytearray | None = None
+) -> bytearray:
+    """Append a full repaint of ``buffer`` to ``out`` (a new bytearray if None)."""
+    if out is None:
+        out = bytearray()
+    fg_sgr, bg_sgr, quantize = COLOR_MODES[colors]
+    rgb_mask, fg_shift, default_fg = RGB_MASK, FG_SHIFT, DEFAULT_FG
+    width = buffer.width
+    ch, attr = buffer.ch, buffer.attr
+    for y in range(buffer.height):
+        if y:
+            out += b"\n"
+        last_fg = 0
+        last_bg = -1
+        start = y * width
+        row_attr = attr[start : start + width]
+        if quantize:
+            row_attr = list(map(quantize, row_attr))
+        for value, glyph in zip(row_attr, ch[start : start + width]):
+            cell_bg = value & rgb_mask
+            if cell_bg != last_bg:
+                out += bg_sgr(cell_bg)
+                last_bg = cell_bg
+            cell_fg = value >> fg_shift
+            if cell_fg != last_fg:
+                out += fg_sgr(cell_fg & rgb_mask) if cell_fg else default_fg
+                last_fg = cell_fg
+            out += glyph
+        out += RESET
+    return out
+
+
+def render_diff(
+    buffer: FrameBuffer,
+    previous: FrameBuffer,
+    colors: str = "truecolor",
+    out: bytearray | None = None,
+) -> bytearray:
+    """Append only the cells that changed since ``previous`` to ``out``.
+
+    Each run of changed cells starts with an absolute cursor move; SGR state
+    carries over between runs so unchanged colors are not re-sent.
+    """
+    if out is None:
+        out = bytearray()
+    mark = len(out)
+    fg_sgr, bg_sgr, quantize = COLOR_MODES[colors]
+    rgb_mask, fg_shift, default_fg = RGB_MASK, FG_SHIFT, DEFAULT_FG
+    width = buffer.width
+    columns = range(width)
+    ch, attr = buffer.ch, buffer.attr
+    prev_ch, prev_attr = previous.ch, previous.attr
+    last_fg = 0
+    last_bg = -1
+    for y in range(buffer.height):
+        start = y * width
+        stop = start + width
+        row_attr, row_ch = attr[start:stop], ch[start:stop]
+        prev_row_attr = prev_attr[start:stop]
+        if row_ch == prev_ch[start:stop] and row_attr == prev_row_attr:
+            continue
+        if quantize:
+            row_attr = list(map(quantize, row_attr))
+            prev_row_attr = list(map(quantize, prev_row_attr))
+        row_move = f"{ESC}[{y + 1};"
+        cursor = -1
+        for x, value, prev_value, glyph, prev_glyph in zip(
+            columns, row_attr, prev_row_attr, row_ch, prev_ch[start:stop]
+        ):
+            if value == prev_value and glyph == prev_glyph:
+                continue
+            if x != cursor:
+                out += f"{row_move}{x + 1}H".encode()
+            cell_bg = value & rgb_mask
+            if cell_bg != last_bg:
+                out += bg_sgr(cell_bg)
+                last_bg = cell_bg
+            cell_fg = value >> fg_shift
+            if cell_fg != last_fg:
+                out += fg_sgr(cell_fg & rgb_mask) if cell_fg else default_fg
+                last_fg = cell_fg
+            out += glyph
+            cursor = x + 1
+    if len(out) > mark:
+        out += RESET
+    return out
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Two samurai dueling in the rain.")
+    parser.add_argument(
+        "--colors",
+        choices=("truecolor", "256"),
+        default="truecolor",
+        help="color output; 256 maps colors to the xterm palette (default: truecolor)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    colors = args.colors
     fps = 30
     duration = 10
     total_frames = fps * duration
     frame = 0
     paused = False
+    previous: FrameBuffer | None = None
+    out = bytearray()
+    size = get_terminal_size(fallback=(120, 40))
 
     def handle_resize(_signum, _frame) -> None:
-        pass
+        nonlocal size, previous
+        size = get_terminal_size(fallback=(120, 40))
+        # Terminals may clear or reflow the screen on resize, so the next
+        # frame cannot be diffed against what was drawn before.
+        previous = None
+        background_template.cache_clear()
+        rain_layers.cache_clear()
+        scene_layout.cache_clear()
 
     signal.signal(signal.SIGWINCH, handle_resize)
 
@@ -218,19 +526,23 @@ def main() -> int:
             if not paused:
                 frame = (frame + 1) % total_frames
 
-            size = get_terminal_size(fallback=(120, 40))
             width = max(40, size.columns)
             height = max(20, size.lines)
             buffer = build_frame(width, height - 1, frame)
-            frame_text = render_frame(buffer)
+            out.clear()
+            if previous is not None and (previous.width, previous.height) == (width, height - 1):
+                render_diff(buffer, previous, colors, out)
+            else:
+                out += b"\x1b[H"
+                render_frame(buffer, colors, out)
+            previous = buffer
             status = (
                 f" Frame {frame + 1:03d}/{total_frames} "
                 f"{'(paused)' if paused else ''} "
                 " | Space: pause/resume  R: restart  Q: quit "
             )
             status = status[: width - 1].ljust(width - 1)
-            sys.stdout.write(f"{ESC}[H{frame_text}\n{reset_colors()}{status}")
-            sys.stdout.flush()
+            write_all(out, f"{ESC}[{height};1H{reset_colors()}{status}".encode())
     finally:
         termios.tcsetattr(sys.stdin, termios.TCSADRAIN, old_settings)
         exit_alt_screen()